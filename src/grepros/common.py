@@ -100,6 +100,13 @@ class ConsolePrinter(object):
     ## {sys.stdout: number of texts printed, sys.stderr: ..}
     PRINTS = {}
 
+    ## Number of texts to print to non-terminal stdout between forced flushes
+    FLUSH_INTERVAL = 100
+
+    ## Maximum seconds between forced flushes to non-terminal stdout,
+    ## to keep piped output timely on low print rates
+    FLUSH_MAX_DELAY = 0.1
+
     ## Whether logging debugs and warnings and raising errors, instead of printing
     APIMODE = False
 
@@ -109,6 +116,10 @@ class ConsolePrinter(object):
 
     _UNIQUES = set()   ## Unique texts printed with `__once=True`
 
+    _TTYS = {}         ## {fileobj: whether terminal}, cached to avoid isatty() per print
+
+    _FLUSHED = 0       ## Timestamp of last forced flush to non-terminal stdout
+
     @classmethod
     def configure(cls, color=True, apimode=False):
         """
@@ -140,12 +151,12 @@ class ConsolePrinter(object):
         cls.COLOR = (cls._COLORFLAG is not False)
         try:
             curses.setupterm()
-            if cls.COLOR and not sys.stdout.isatty():
+            if cls.COLOR and not cls.is_tty(sys.stdout):
                 raise Exception()
         except Exception:
             cls.COLOR = bool(cls._COLORFLAG)
         try:
-            if sys.stdout.isatty() or cls.COLOR:
+            if cls.is_tty(sys.stdout) or cls.COLOR:
                 cls.WIDTH = curses.initscr().getmaxyx()[1]
             curses.endwin()
         except Exception: pass
@@ -160,6 +171,13 @@ class ConsolePrinter(object):
             cls.ERROR_START, cls.ERROR_END = "", ""
 
 
+    @classmethod
+    def is_tty(cls, fileobj):
+        """Returns whether file object is a terminal, using cached result if available."""
+        if fileobj not in cls._TTYS: cls._TTYS[fileobj] = fileobj.isatty()
+        return cls._TTYS[fileobj]
+
+
     @classmethod
     def print(cls, text="", *args, **kwargs):
         """
@@ -183,7 +201,13 @@ class ConsolePrinter(object):
         cls._LINEOPEN = "\n" not in end
         cls.init_terminal()
         print(pref + text + suff, end=end, file=fileobj)
-        not fileobj.isatty() and fileobj.flush()
+        if not cls.is_tty(fileobj):
+            # Flush piped stdout in count- and time-bounded batches,
+            # other non-terminal streams per print
+            if fileobj is not sys.stdout or not cls.PRINTS[fileobj] % cls.FLUSH_INTERVAL \
+            or time.time() - cls._FLUSHED >= cls.FLUSH_MAX_DELAY:
+                fileobj.flush()
+                if fileobj is sys.stdout: cls._FLUSHED = time.time()
 
 
     @classmethod
@@ -294,6 +318,9 @@ class ArgumentUtil(object):
     PRECASTS            = {"NTH_INTERVAL": lambda v: import_item("grepros.api").to_sec(v)}
     DEDUPE_UNLESS       = {"PATTERN": "EXPRESSION"}
 
+    ## Cached make_parser() results, as {(formatter, help pending, spec repr): ArgumentParser}
+    PARSERS             = {}
+
 
     class HelpFormatter(argparse.RawTextHelpFormatter):
         """RawTextHelpFormatter returning custom metavar for non-flattenable list arguments."""
@@ -310,21 +337,33 @@ class ArgumentUtil(object):
     @classmethod
     def make_parser(cls, arguments, formatter=HelpFormatter):
         """
-        Returns a configured ArgumentParser instance for program arguments.
+        Returns a configured ArgumentParser instance for program arguments,
+        from cache if already made for identical spec content.
+
+        Returned parser is shared: callers needing to modify an independent instance
+        can copy.deepcopy() the result.
 
         @param  arguments  argparse options as {description, epilog, arguments: [], groups: []}
         @param  formatter  help formatter class to use
         """
-        kws = dict(description=arguments["description"], epilog=arguments["epilog"],
+        helping = bool({"-h", "--help"} & set(sys.argv[1:]))
+        cachekey = (formatter, helping, repr(arguments))  # Spec gets mutated by plugins
+        if cachekey in cls.PARSERS: return cls.PARSERS[cachekey]
+        epilog = arguments.get("epilog")
+        if callable(epilog):  # Deferred epilog: materialize only if help display pending
+            epilog = epilog() if helping else None
+        kws = dict(description=arguments["description"], epilog=epilog,
                    formatter_class=formatter, add_help=False)
         if sys.version_info >= (3, 5): kws.update(allow_abbrev=False)
         argparser = argparse.ArgumentParser(**kws)
-        for arg in map(dict, arguments["arguments"]):
-            argparser.add_argument(*arg.pop("args"), **arg)
+        def add_arguments(target, arglist):
+            """Adds arguments to parser or group, without copying or mutating specs."""
+            for arg in arglist:
+                target.add_argument(*arg["args"], **{k: v for k, v in arg.items() if "args" != k})
+        add_arguments(argparser, arguments["arguments"])
         for group, groupargs in arguments.get("groups", {}).items():
-            grouper = argparser.add_argument_group(group)
-            for arg in map(dict, groupargs):
-                grouper.add_argument(*arg.pop("args"), **arg)
+            add_arguments(argparser.add_argument_group(group), groupargs)
+        cls.PARSERS[cachekey] = argparser
         return argparser
 
 
@@ -352,14 +391,27 @@ class ArgumentUtil(object):
             if k not in cls.NO_FLATTENS:
                 v2 = [x for xx in v2 for x in (xx if isinstance(xx, list) else [xx])]
             if k not in cls.DEDUPE_UNLESS or not getattr(args, cls.DEDUPE_UNLESS[k], True):
-                v2 = [here.append(x) or x for here in ([],) for x in v2 if x not in here]
+                try: v2 = list(dict.fromkeys(v2))  # C-level dedupe retaining order
+                except TypeError:  # Unhashable values like lists in WRITE
+                    v2 = [here.append(x) or x for here in ([],) for x in v2 if x not in here]
             if v2 != v: setattr(args, k, v2)
         return args
 
 
     @classmethod
     def transform(cls, args, cli=False):
-        """Sets command-line specific flag state to program argument namespace."""
+        """
+        Converts timestamp arguments in program argument namespace to final form,
+        sets command-line specific flag state if CLI.
+        """
+        for k in ("START_TIME", "END_TIME"):
+            v = getattr(args, k, None)
+            if not isinstance(v, (six.binary_type, six.text_type)): continue  # for k
+            try: v = float(v)
+            except Exception: pass  # If numeric, retain string for source to read as relative time
+            try: v if isinstance(v, float) else setattr(args, k, parse_datetime(v))
+            except Exception: pass
+
         if not cli: return
 
         if args.CONTEXT:
@@ -373,16 +425,9 @@ class ArgumentUtil(object):
                        (False if args.PROGRESS else cli and not args.CONSOLE)
 
         # Print filename prefix on each console message line if not single specific file
-        args.LINE_PREFIX = args.LINE_PREFIX and (args.RECURSE or len(args.FILE) != 1
-                                                 or args.PATH or any("*" in x for x in args.FILE))
+        if args.LINE_PREFIX and not (args.RECURSE or len(args.FILE) != 1 or args.PATH):
+            args.LINE_PREFIX = "*" in "\0".join(args.FILE)  # One C-level scan for wildcards
 
-        for k, v in [("START_TIME", args.START_TIME), ("END_TIME", args.END_TIME)]:
-            if not isinstance(v, (six.binary_type, six.text_type)): continue  # for v, k
-            try: v = float(v)
-            except Exception: pass  # If numeric, retain string for source to read as relative time
-            try: v if isinstance(v, float) else setattr(args, k, parse_datetime(v))
-            except Exception: pass
-        
 
     @classmethod
     def verify(cls, args):
@@ -403,14 +448,14 @@ class ArgumentUtil(object):
                 errors.append('Invalid KEY=VALUE in "--write %s": %s' %
                               (" ".join(opts), " ".join(erropts)))
 
-        for n in ("START_TIME", "END_TIME"):
-            v = getattr(args, n, None)
-            if v is None: continue  # for v, n
-            try: v = float(v)
-            except Exception: pass
-            try: isinstance(v, (six.binary_type, six.text_type)) and parse_datetime(v)
-            except Exception: errors.append("Invalid ISO datetime for %s: %s" %
-                                            (n.lower().replace("_", " "), v))
+        for n in ("START_TIME", "END_TIME"):  # Parsed in transform(): strings remaining
+            v = getattr(args, n, None)        # are numeric relative times or invalid
+            if not isinstance(v, (six.binary_type, six.text_type)): continue  # for n
+            try: float(v)
+            except Exception:
+                try: parse_datetime(v)
+                except Exception: errors.append("Invalid ISO datetime for %s: %s" %
+                                                (n.lower().replace("_", " "), v))
 
         errors.extend(cls.process_types(args))
 
@@ -464,6 +509,9 @@ class Decompressor(object):
     ## zstd file header magic start bytes
     ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
 
+    ## Cached is_compressed() results, as {file path: bool}
+    RESULTS = {}
+
 
     @classmethod
     def decompress(cls, path, progress=False):
@@ -501,13 +549,15 @@ class Decompressor(object):
 
     @classmethod
     def is_compressed(cls, path):
-        """Returns whether file is a recognized archive."""
-        result = os.path.isfile(path)
+        """Returns whether file is a recognized archive, using cached result if available."""
+        if path in cls.RESULTS: return cls.RESULTS[path]
+        result = any(str(path).lower().endswith(x) for x in cls.EXTENSIONS)
         if result:
-            result = any(str(path).lower().endswith(x) for x in cls.EXTENSIONS)
+            result = os.path.isfile(path)
         if result:
             with open(path, "rb") as f:
                 result = (f.read(len(cls.ZSTD_MAGIC)) == cls.ZSTD_MAGIC)
+        cls.RESULTS[path] = result
         return result
 
 
@@ -1146,6 +1196,7 @@ def parse_number(value, suffixes=None):
     return int(float(value) * (suffixes[suffix] if suffix else 1))
 
 
+@memoize
 def path_to_regex(text, sep=".", wildcard="*", end=False, intify=False):
     """
     Returns re.Pattern for matching path strings with optional integer indexes.
@@ -1293,6 +1344,7 @@ def verify_io(f, mode):
                 except Exception: pass
 
 
+@memoize
 def wildcard_to_regex(text, end=False):
     """
     Returns plain wildcard like "foo*bar" as re.Pattern("foo.*bar", re.I).
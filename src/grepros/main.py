@@ -20,16 +20,16 @@ import signal
 import sys
 import traceback
 
-from . import __title__, __version__, __version_date__, api, inputs, outputs, search
+from . import __title__, __version__, __version_date__
 from . common import ArgumentUtil, ConsolePrinter, MatchMarkers
-from . import plugins
 
 
 
 ## Configuration for argparse, as {description, epilog, args: [..], groups: {name: [..]}}
 ARGUMENTS = {
     "description": "Searches through messages in ROS bag files or live topics.",
-    "epilog":      """
+    # Deferred as callable: only needed for --help display
+    "epilog":      lambda: """
 PATTERNs use Python regular expression syntax, message matches if all match.
 * wildcards use simple globbing as zero or more characters,
 target matches if any value matches.
@@ -103,6 +103,17 @@ Export all bag messages to SQLite and Postgres, print only export progress:
                   "like 'this AND (this2 OR NOT \"skip this\")',\n"
                   "with elements as patterns to find in message fields"),
 
+        dict(args=["--regex-engine"],
+             dest="REGEX_ENGINE", choices=["re", "re2", "hyperscan"], default="re",
+             help="regular expression engine to match PATTERNs with\n"
+                  '("re2" and "hyperscan" need optional dependencies installed,\n'
+                  'default "re")'),
+
+        dict(args=["-j", "--jobs"],
+             dest="JOBS", metavar="NUM", default=1, type=int,
+             help="number of worker threads to match messages with\n"
+                  "(default 1, used for bag sources only)"),
+
         dict(args=["--version"],
              dest="VERSION", action="version",
              version="%s: grep for ROS bag files and live topics, v%s (%s)" %
@@ -398,14 +409,18 @@ CLI_ARGS = None
 
 
 def flush_stdout():
-    """Writes a linefeed to sdtout if nothing has been printed to it so far."""
-    if not ConsolePrinter.PRINTS.get(sys.stdout) and not sys.stdout.isatty():
+    """Writes a linefeed to sdtout if nothing has been printed to it so far, flushes output."""
+    if not ConsolePrinter.PRINTS.get(sys.stdout) and not ConsolePrinter.is_tty(sys.stdout):
         try: print()  # Piping cursed output to `more` remains paging if nothing is printed
         except (Exception, KeyboardInterrupt): pass
+    else:
+        try: sys.stdout.flush()  # Push out any batched non-terminal output
+        except (Exception, KeyboardInterrupt): pass
 
 
 def preload_plugins(cli_args):
     """Imports and initializes plugins from auto-load folder and from arguments."""
+    from . import outputs, plugins  # Imported late to speed up program startup
     plugins.add_write_format("bag", outputs.BagSink, "bag", [
         ("overwrite=true|false",   "overwrite existing file\nin bag output\n"
                                    "instead of appending to if bag or database\n"
@@ -425,6 +440,7 @@ def make_thread_excepthook(args, exitcode_dict):
     """Returns thread exception handler: function(text, exc) prints error, stops application."""
     def thread_excepthook(text, exc):
         """Prints error, sets exitcode flag, shuts down ROS node if any, interrupts main thread."""
+        from . import api  # Imported late to speed up program startup
         ConsolePrinter.error(text)
         if args.VERBOSE: traceback.print_exc()
         exitcode_dict["value"] = 1
@@ -437,6 +453,10 @@ def run():
     """Parses command-line arguments and runs search."""
     global CLI_ARGS
     CLI_ARGS = sys.argv[1:]
+    if ["--version"] == CLI_ARGS:  # Fast path: skip plugin load and argument parser build
+        print("%s: grep for ROS bag files and live topics, v%s (%s)" %
+              (__title__, __version__, __version_date__))
+        return
     MatchMarkers.populate("%08x" % random.randint(1, 1E9))
     preload_plugins(CLI_ARGS)
     argparser = ArgumentUtil.make_parser(ARGUMENTS)
@@ -450,6 +470,9 @@ def run():
         argparser.print_help()
         return
 
+    # Imported late to avoid loading ROS bindings for --help/--version/usage only
+    from . import api, inputs, outputs, plugins, search
+
     BREAK_EXS = (KeyboardInterrupt, )
     try: BREAK_EXS += (BrokenPipeError, )  # Py3
     except NameError: pass  # Py2
@@ -922,6 +922,7 @@ class MultiSink(Sink):
         args = common.ensure_namespace(args, **kwargs)
         super(MultiSink, self).__init__(args)
         self.valid = True
+        self._validated = None  # Combined result of validating all sinks, cached
 
         ## List of all combined sinks
         self.sinks = [cls(args) for flag, cls in self.FLAG_CLASSES.items()
@@ -979,10 +980,13 @@ class MultiSink(Sink):
         for sink in self.sinks: sink.configure(args, **kwargs)
 
     def validate(self):
-        """Returns whether prerequisites are met for all sinks."""
+        """Returns whether prerequisites are met for all sinks, using cached result if available."""
+        if self._validated is not None: return self._validated
         if not self.sinks:
             ConsolePrinter.error("No output configured.")
-        return bool(self.sinks) and all([sink.validate() for sink in self.sinks]) and self.valid
+        self._validated = bool(self.sinks) and all([sink.validate() for sink in self.sinks]) \
+                          and self.valid
+        return self._validated
 
     def close(self):
         """Closes all sinks."""
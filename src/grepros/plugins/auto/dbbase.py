@@ -14,6 +14,7 @@ Released under the BSD License.
 ## @namespace grepros.plugins.auto.dbbase
 import atexit
 import collections
+import operator
 
 from ... import api
 from ... common import PATH_TYPES, ConsolePrinter, ensure_namespace, plural
@@ -96,9 +97,14 @@ class BaseDataSink(Sink, SqlMixin):
         # In parent, nested arrays are inserted as foreign keys instead of formatted values.
         self._nesting = None
 
-        self._checkeds      = {}  # {topickey/typekey: whether existence checks are done}
+        self._checked_topics = set()  # {topickey: topics with existence checks done}
+        self._checked_types  = set()  # {typekey: types with existence checks done}
+        self._extra_colnames = () # Meta-column names for message inserts, set in _init_db
         self._sql_queue     = {}  # {SQL: [(args), ]}
+        self._queued_count  = 0   # Number of arguments queued for batch execution
         self._nested_counts = {}  # {(typename, typehash): count}
+        self._nested_layouts = {} # {(typename, typehash): [(path, getter, scalar type, is array)]}
+        self._last_stamp    = None  # Last converted timestamp, as (stamp, datetime, nanoseconds)
 
         atexit.register(self.close)
 
@@ -157,8 +163,11 @@ class BaseDataSink(Sink, SqlMixin):
                         plural("nested message", sum(self._nested_counts.values())),
                         plural("nested message type", self._nested_counts), self.ENGINE
                     )
-            self._checkeds.clear()
+            self._checked_topics.clear()
+            self._checked_types.clear()
             self._nested_counts.clear()
+            self._nested_layouts.clear()
+            self._last_stamp = None
             SqlMixin.close(self)
             super(BaseDataSink, self).close()
 
@@ -168,7 +177,10 @@ class BaseDataSink(Sink, SqlMixin):
         if self.db:
             for sql in list(self._sql_queue):
                 self._executemany(sql, self._sql_queue.pop(sql))
-            self.db.commit()
+            self._queued_count = 0
+            index_sql = self._get_dialect_option("index_schema")
+            if index_sql: self._executescript(index_sql)  # Index creation deferred to close
+            self._commit()
             self._cursor.close()
             self._cursor = None
             self.db.close()
@@ -177,7 +189,7 @@ class BaseDataSink(Sink, SqlMixin):
 
     def _init_db(self):
         """Opens database connection, and populates schema if not already existing."""
-        for d in (self._checkeds, self._topics, self._types): d.clear()
+        for d in (self._checked_topics, self._checked_types, self._topics, self._types): d.clear()
         self._close_printed = False
 
         if "commit-interval" in self.args.WRITE_OPTIONS:
@@ -185,11 +197,14 @@ class BaseDataSink(Sink, SqlMixin):
         self.db = self._connect()
         self._cursor = self._make_cursor()
         self._executescript(self._get_dialect_option("base_schema"))
-        self.db.commit()
+        self._commit()
         self._load_schema()
         TYPECOLS = self.MESSAGE_TYPE_TOPICCOLS + self.MESSAGE_TYPE_BASECOLS
         if self._nesting: TYPECOLS += self.MESSAGE_TYPE_NESTCOLS
         self._ensure_columns(TYPECOLS)
+        coldefs = self.MESSAGE_TYPE_TOPICCOLS + self.MESSAGE_TYPE_BASECOLS[:-1]
+        if self._nesting: coldefs += self.MESSAGE_TYPE_BASECOLS[-1:] + self.MESSAGE_TYPE_NESTCOLS
+        self._extra_colnames = tuple(c for c, _ in coldefs)
 
 
     def _load_schema(self):
@@ -197,12 +212,12 @@ class BaseDataSink(Sink, SqlMixin):
         self._cursor.execute("SELECT * FROM topics")
         for row in self._cursor.fetchall():
             topickey = (row["name"], row["md5"])
-            self._topics[topickey] = row
+            self._topics[topickey] = dict(row)  # Copied to dict: mutated later
 
         self._cursor.execute("SELECT * FROM types")
         for row in self._cursor.fetchall():
             typekey = (row["type"], row["md5"])
-            self._types[typekey] = row
+            self._types[typekey] = dict(row)
 
 
     def _process_topic(self, topic, msg):
@@ -213,7 +228,7 @@ class BaseDataSink(Sink, SqlMixin):
         If nesting enabled, creates types recursively.
         """
         topickey = api.TypeMeta.make(msg, topic).topickey
-        if topickey in self._checkeds:
+        if topickey in self._checked_topics:
             return
 
         if topickey not in self._topics:
@@ -228,8 +243,8 @@ class BaseDataSink(Sink, SqlMixin):
                 ConsolePrinter.debug("Adding topic %s in %s output.", topic, self.ENGINE)
             self._topics[topickey]["id"] = self._execute_insert(sql, args)
 
-            if self.COMMIT_INTERVAL: self.db.commit()
-        self._checkeds[topickey] = True
+            if self.COMMIT_INTERVAL: self._commit()
+        self._checked_topics.add(topickey)
 
 
     def _process_type(self, msg, rootmsg=None):
@@ -241,7 +256,7 @@ class BaseDataSink(Sink, SqlMixin):
         rootmsg = rootmsg or msg
         with api.TypeMeta.make(msg, root=rootmsg) as m:
             typename, typekey = (m.typename, m.typekey)
-        if typekey in self._checkeds:
+        if typekey in self._checked_types:
             return None
 
         if typekey not in self._types:
@@ -259,23 +274,20 @@ class BaseDataSink(Sink, SqlMixin):
 
 
         nested_tables = self._types[typekey].get("nested_tables") or {}
-        nesteds = api.iter_message_fields(msg, messages_only=True) if self._nesting else ()
-        for path, submsgs, subtype in nesteds:
-            scalartype = api.scalar(subtype)
-            if subtype == scalartype and "all" != self._nesting:
-                continue  # for path
-
+        nesteds = self._get_nested_fields(msg, typekey) if self._nesting else ()
+        for path, getval, scalartype, _ in nesteds:
+            submsgs = getval(msg)
             subtypehash = not submsgs and self.source.get_message_type_hash(scalartype)
             if not isinstance(submsgs, (list, tuple)): submsgs = [submsgs]
             [submsg] = submsgs[:1] or [self.source.get_message_class(scalartype, subtypehash)()]
             subdata = self._process_type(submsg, rootmsg)
-            if subdata: nested_tables[".".join(path)] = subdata["table_name"]
+            if subdata: nested_tables[path] = subdata["table_name"]
         if nested_tables:
             self._types[typekey]["nested_tables"] = nested_tables
             sets, where = {"nested_tables": nested_tables}, {"id": self._types[typekey]["id"]}
             sql, args = self._make_update_sql("types", sets, where)
             self._cursor.execute(sql, args)
-        self._checkeds[typekey] = True
+        self._checked_types.add(typekey)
         return self._types[typekey]
 
 
@@ -288,10 +300,12 @@ class BaseDataSink(Sink, SqlMixin):
         """
         self._populate_type(topic, msg, stamp)
         if self.COMMIT_INTERVAL:
-            do_commit = sum(len(v) for v in self._sql_queue.values()) >= self.COMMIT_INTERVAL
+            do_commit = self._queued_count >= self.COMMIT_INTERVAL
             for sql in list(self._sql_queue) if do_commit else ():
                 self._executemany(sql, self._sql_queue.pop(sql))
-            do_commit and self.db.commit()
+            if do_commit:
+                self._queued_count = 0
+                self._commit()
 
 
     def _populate_type(self, topic, msg, stamp,
@@ -310,31 +324,27 @@ class BaseDataSink(Sink, SqlMixin):
         table_name = self._types[typekey]["table_name"]
 
         myid = self._get_next_id(table_name) if self._nesting else None
-        coldefs = self.MESSAGE_TYPE_TOPICCOLS + self.MESSAGE_TYPE_BASECOLS[:-1]
-        colvals = [topic, topic_id, api.to_datetime(stamp), api.to_nsec(stamp)]
+        dt, nsec = self._convert_stamp(stamp)
+        colvals = [topic, topic_id, dt, nsec]
         if self._nesting:
-            coldefs += self.MESSAGE_TYPE_BASECOLS[-1:] + self.MESSAGE_TYPE_NESTCOLS
             colvals += [myid, parent_type, parent_id]
-        extra_cols = list(zip([c for c, _ in coldefs], colvals))
+        extra_cols = list(zip(self._extra_colnames, colvals))
         sql, args = self._make_message_insert_sql(topic, msg, extra_cols)
         self._ensure_execute(sql, args)
         if parent_type: self._nested_counts[typekey] = self._nested_counts.get(typekey, 0) + 1
 
         subids = {}  # {message field path: [ids]}
-        nesteds = api.iter_message_fields(msg, messages_only=True) if self._nesting else ()
-        for subpath, submsgs, subtype in nesteds:
-            scalartype = api.scalar(subtype)
-            if subtype == scalartype and "all" != self._nesting:
-                continue  # for subpath
-            if isinstance(submsgs, (list, tuple)):
+        nesteds = self._get_nested_fields(msg, typekey) if self._nesting else ()
+        for subpath, getval, _, is_array in nesteds:
+            submsgs = getval(msg)
+            if is_array:
                 subids[subpath] = []
-            for submsg in submsgs if isinstance(submsgs, (list, tuple)) else [submsgs]:
+            for submsg in submsgs if is_array else [submsgs]:
                 subid = self._populate_type(topic, submsg, stamp, rootmsg, typename, myid)
-                if isinstance(submsgs, (list, tuple)):
+                if is_array:
                     subids[subpath].append(subid)
         if subids:
-            sets, where = {".".join(p): subids[p] for p in subids}, {"_id": myid}
-            sql, args = self._make_update_sql(table_name, sets, where)
+            sql, args = self._make_update_sql(table_name, subids, {"_id": myid})
             self._ensure_execute(sql, args)
         return myid
 
@@ -350,18 +360,55 @@ class BaseDataSink(Sink, SqlMixin):
                 typecols[c] = t
         if sqls:
             self._executescript("\n".join(sqls))
-            self.db.commit()
+            self._commit()
+
+
+    def _convert_stamp(self, stamp):
+        """Returns (datetime, nanoseconds) for ROS timestamp, caching last converted value."""
+        last = self._last_stamp
+        if last is None or last[0] != stamp:  # Stamps often repeat in batched sensor frames
+            last = self._last_stamp = (stamp, api.to_datetime(stamp), api.to_nsec(stamp))
+        return last[1], last[2]
+
+
+    def _get_nested_fields(self, msg, typekey):
+        """
+        Returns nested message fields for type, cached per type.
+
+        Skips non-array fields if nesting only arrays.
+
+        @return   [(field path as "a.b", getter(msg), scalar type name, whether array)]
+        """
+        layout = self._nested_layouts.get(typekey)
+        if layout is None:  # Nested field paths and types are fixed per type: walk fields once
+            layout = self._nested_layouts[typekey] = []
+            for path, _, subtype in api.iter_message_fields(msg, messages_only=True):
+                scalartype = api.scalar(subtype)
+                if subtype == scalartype and "all" != self._nesting:
+                    continue  # for path
+                pathstr = ".".join(path)
+                layout.append((pathstr, operator.attrgetter(pathstr),
+                               scalartype, subtype != scalartype))
+        return layout
 
 
     def _ensure_execute(self, sql, args):
         """Executes SQL if in autocommit mode, else caches arguments for batch execution."""
         args = tuple(args) if isinstance(args, list) else args
         if self.COMMIT_INTERVAL:
-            self._sql_queue.setdefault(sql, []).append(args)
+            queue = self._sql_queue.get(sql)
+            if queue is None: queue = self._sql_queue[sql] = []
+            queue.append(args)
+            self._queued_count += 1
         else:
             self._cursor.execute(sql, args)
 
 
+    def _commit(self):
+        """Commits pending transaction, if any."""
+        self.db.commit()
+
+
     def _connect(self):
         """Returns new database connection."""
         raise NotImplementedError()
@@ -13,6 +13,7 @@ Released under the BSD License.
 """
 ## @namespace grepros.plugins.auto.sqlbase
 import json
+import operator
 import re
 
 import yaml
@@ -49,7 +50,10 @@ class SqlMixin(object):
         self._topics    = {}  # {(topic, typename, typehash): {name, table_name, view_name, sql, ..}}
         self._types     = {}  # {(typename, typehash): {type, table_name, sql, ..}}
         self._schema    = {}  # {(typename, typehash): {cols}}
-        self._sql_cache = {}  # {table: "INSERT INTO table VALUES (%s, ..)"}
+        self._sql_cache = {}  # {table or (table, setcols, wherecols): INSERT/UPDATE SQL}
+        self._field_layouts = {}  # {(typename, typehash): [(path, typename, get function), ]}
+        self._scalars   = None  # Scalar types mapped in current dialect, cached
+        self._entity_names = None  # All known table and view names, seeded in _make_entity_name
         self._dialect   = None
         self._nesting   = None
 
@@ -120,6 +124,9 @@ class SqlMixin(object):
         self._types.clear()
         self._schema.clear()
         self._sql_cache.clear()
+        self._field_layouts.clear()
+        self._scalars = None
+        self._entity_names = None
 
 
     def _make_topic_data(self, topic, msg, exclude_cols=()):
@@ -169,8 +176,7 @@ class SqlMixin(object):
             typename, typehash = (m.typename, m.typehash)
 
         cols = []
-        scalars = set(x for x in self._get_dialect_option("types") if x == api.scalar(x))
-        for path, value, subtype in api.iter_message_fields(msg, scalars=scalars):
+        for path, value, subtype in api.iter_message_fields(msg, scalars=self._get_scalars()):
             coltype = self._make_column_type(subtype)
             cols += [(".".join(path), coltype)]
         cols.extend(extra_cols or [])
@@ -221,10 +227,14 @@ class SqlMixin(object):
         table_name = self._types[typekey]["table_name"]
         sql, cols, args = self._sql_cache.get(table_name), [], []
 
-        scalars = set(x for x in self._get_dialect_option("types") if x == api.scalar(x))
-        for p, v, t in api.iter_message_fields(msg, scalars=scalars):
-            if not sql: cols.append(".".join(p))
-            args.append(self._make_column_value(v, t))
+        layout = self._field_layouts.get(typekey)
+        if layout is None:  # Field paths and types are fixed per type: walk fields once
+            layout = self._field_layouts[typekey] = \
+                [(p, t, self._make_value_getter(p, t))
+                 for p, _, t in api.iter_message_fields(msg, scalars=self._get_scalars())]
+        if not sql: cols = [".".join(p) for p, _, _ in layout]
+        for _, t, getval in layout:
+            args.append(self._make_column_value(getval(msg), t))
         args = tuple(args) + tuple(v for _, v in extra_cols)
 
         if not sql:
@@ -238,15 +248,31 @@ class SqlMixin(object):
         return sql, args
 
 
+    def _make_value_getter(self, path, typename):
+        """Returns function(msg) fetching field value at path, with leaf type conversions."""
+        get_parent = operator.attrgetter(".".join(path[:-1])) if len(path) > 1 else None
+        leafname = path[-1]
+        def getval(msg):
+            """Returns field value from message, converted for database insert."""
+            return api.get_message_value(get_parent(msg) if get_parent else msg,
+                                         leafname, typename)
+        return getval
+
+
     def _make_update_sql(self, table, values, where=()):
-        """Returns ("UPDATE ..", [args])."""
-        POSARG = self._get_dialect_option("posarg")
-        sql, args, sets, filters = "UPDATE %s SET " % quote(table), [], [], []
-        for lst, vals in [(sets, values), (filters, where)]:
-            for k, v in vals.items() if isinstance(vals, dict) else vals:
-                lst.append("%s = %s" % (quote(k), POSARG))
-                args.append(self._make_column_value(v))
-        sql += ", ".join(sets) + (" WHERE " if filters else "") + " AND ".join(filters)
+        """Returns ("UPDATE ..", [args]), with SQL cached per table and column set."""
+        setvals   = list(values.items() if isinstance(values, dict) else values)
+        wherevals = list(where.items()  if isinstance(where,  dict) else where)
+        cachekey  = (table, tuple(k for k, _ in setvals), tuple(k for k, _ in wherevals))
+        sql = self._sql_cache.get(cachekey)
+        if sql is None:
+            POSARG  = self._get_dialect_option("posarg")
+            sets    = ["%s = %s" % (quote(k), POSARG) for k, _ in setvals]
+            filters = ["%s = %s" % (quote(k), POSARG) for k, _ in wherevals]
+            sql = "UPDATE %s SET %s%s%s" % (quote(table), ", ".join(sets),
+                                            " WHERE " if filters else "", " AND ".join(filters))
+            self._sql_cache[cachekey] = sql
+        args = [self._make_column_value(v) for _, v in setvals + wherevals]
         return sql, args
 
 
@@ -257,10 +283,13 @@ class SqlMixin(object):
         @param   args  format arguments for table/view name template
         """
         name = self._get_dialect_option("%s_name_template" % category).format(**args)
-        existing = set(sum(([x["table_name"], x.get("view_name")]
-                            for dct in (self._topics, self._types)
-                            for x in dct.values()), []))
-        return self._make_name("entity", name, existing)
+        if self._entity_names is None:  # Seed from loaded schema, then maintain incrementally
+            self._entity_names = set(x[k] for dct in (self._topics, self._types)
+                                     for x in dct.values() for k in ("table_name", "view_name")
+                                     if x.get(k))
+        result = self._make_name("entity", name, self._entity_names)
+        self._entity_names.add(result)
+        return result
 
 
     def _make_name(self, category, name, existing=()):
@@ -376,6 +405,14 @@ class SqlMixin(object):
         return self.DIALECTS[self._dialect].get(option, self.DIALECTS[None].get(option))
 
 
+    def _get_scalars(self):
+        """Returns scalar types mapped in current dialect, cached."""
+        if self._scalars is None:
+            self._scalars = set(x for x in self._get_dialect_option("types")
+                                if x == api.scalar(x))
+        return self._scalars
+
+
     ## Supported SQL dialects and options
     DIALECTS = {
 
@@ -445,14 +482,14 @@ CREATE TABLE IF NOT EXISTS types (
   table_name    TEXT    NOT NULL,
   nested_tables JSON
 );
-
+""",
+            # Created at output close: B-tree maintenance would slow down bulk insert
+            "index_schema": """
 CREATE INDEX IF NOT EXISTS timestamp_idx ON messages (timestamp ASC);
-
-PRAGMA journal_mode = WAL;
 """,
             "insert_message": """
 INSERT INTO messages (topic_id, timestamp, data, topic, type, dt, yaml)
-VALUES (:topic_id, :timestamp, :data, :topic, :type, :dt, :yaml)
+VALUES (?, ?, ?, ?, ?, ?, ?)
 """,
         },
 
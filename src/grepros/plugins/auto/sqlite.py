@@ -15,7 +15,10 @@ Released under the BSD License.
 import collections
 import json
 import os
+try: import queue  # Py3
+except ImportError: import Queue as queue  # Py2
 import sqlite3
+import threading
 
 import six
 
@@ -57,6 +60,12 @@ class SqliteSink(BaseDataSink, RolloverSinkMixin):
     ## Maximum integer size supported in SQLite, higher values inserted as string
     MAX_INT = 2**63 - 1
 
+    ## Write-throughput PRAGMAs issued on every new connection
+    CONNECT_PRAGMAS = ("journal_mode = WAL", "synchronous = NORMAL", "temp_store = MEMORY")
+
+    ## Whether sqlite3 module adapters and converters have been registered
+    _ADAPTERS_REGISTERED = False
+
     ## Constructor argument defaults
     DEFAULT_ARGS = dict(META=False, WRITE_OPTIONS={}, VERBOSE=False)
 
@@ -68,6 +77,7 @@ class SqliteSink(BaseDataSink, RolloverSinkMixin):
         @param   args.write           name of SQLite file to write, will be appended to if exists
         @param   args.write_options   ```
                                       {"commit-interval": transaction size (0 is autocommit),
+                                       "message-data": populate messages.data (default true),
                                        "message-yaml": populate messages.yaml (default true),
                                        "nesting": "array" to recursively insert arrays
                                                   of nested types, or "all" for any nesting),
@@ -88,23 +98,28 @@ class SqliteSink(BaseDataSink, RolloverSinkMixin):
         super(SqliteSink, self).__init__(args, **kwargs)
         RolloverSinkMixin.__init__(self, args)
 
+        self._do_data     = None
         self._do_yaml     = None
         self._overwrite   = None
         self._id_counters = {}  # {table next: max ID}
+        self._queue       = queue.Queue()  # [(topic, msg, stamp, match, index)]
+        self._writer      = None  # threading.Thread running _stream()
 
 
     def validate(self):
         """
         Returns whether "commit-interval" and "nesting" in args.write_options have valid value, if any,
-        and file is writable; parses "message-yaml" and "overwrite" from args.write_options.
+        and file is writable; parses "message-data", "message-yaml" and "overwrite"
+        from args.write_options.
         """
         if self.valid is not None: return self.valid
         ok = all([super(SqliteSink, self).validate(), RolloverSinkMixin.validate(self)])
-        if self.args.WRITE_OPTIONS.get("message-yaml") not in (None, True, False, "true", "false"):
-            ConsolePrinter.error("Invalid message-yaml option for %s: %r. "
-                                 "Choose one of {true, false}.",
-                                 self.ENGINE, self.args.WRITE_OPTIONS["message-yaml"])
-            ok = False
+        for option in ("message-data", "message-yaml"):
+            if self.args.WRITE_OPTIONS.get(option) not in (None, True, False, "true", "false"):
+                ConsolePrinter.error("Invalid %s option for %s: %r. "
+                                     "Choose one of {true, false}.",
+                                     option, self.ENGINE, self.args.WRITE_OPTIONS[option])
+                ok = False
         if self.args.WRITE_OPTIONS.get("overwrite") not in (None, True, False, "true", "false"):
             ConsolePrinter.error("Invalid overwrite option for %s: %r. "
                                  "Choose one of {true, false}.",
@@ -114,17 +129,36 @@ class SqliteSink(BaseDataSink, RolloverSinkMixin):
             ok = False
         self.valid = ok
         if self.valid:
+            self._do_data   = (self.args.WRITE_OPTIONS.get("message-data") != "false")
             self._do_yaml   = (self.args.WRITE_OPTIONS.get("message-yaml") != "false")
             self._overwrite = (self.args.WRITE_OPTIONS.get("overwrite") in (True, "true"))
         return self.valid
 
 
     def emit(self, topic, msg, stamp=None, match=None, index=None):
-        """Writes message to database."""
+        """Queues message for writing to database in writer thread."""
         if not self.validate(): raise Exception("invalid")
         stamp, index = self._ensure_stamp_index(topic, msg, stamp, index)
         RolloverSinkMixin.ensure_rollover(self, topic, msg, stamp)
-        super(SqliteSink, self).emit(topic, msg, stamp, match, index)
+        self._queue.put((topic, msg, stamp, match, index))
+        if not self._writer:
+            self._writer = threading.Thread(target=self._stream)
+            self._writer.start()
+        if "size" in self._rollover_limits or self._queue.qsize() > 100: self._queue.join()
+
+
+    def close_output(self):
+        """Closes database connection, if any, executing any pending statements."""
+        if self._writer:
+            writer, self._writer = self._writer, None
+            self._queue.put(None)
+            writer.is_alive() and writer.join()
+        super(SqliteSink, self).close_output()
+
+
+    def flush(self):
+        """Writes out any pending data to disk."""
+        self._queue.join()
 
 
     @property
@@ -139,10 +173,7 @@ class SqliteSink(BaseDataSink, RolloverSinkMixin):
 
     def _init_db(self):
         """Opens the database file and populates schema if not already existing."""
-        for t in (dict, list, tuple): sqlite3.register_adapter(t, json.dumps)
-        for t in six.integer_types:
-            sqlite3.register_adapter(t, lambda x: str(x) if abs(x) > self.MAX_INT else x)
-        sqlite3.register_converter("JSON", json.loads)
+        self._register_adapters()
         self.filename = self.filename or self.make_filename()
         if self.args.VERBOSE:
             sz = self.size
@@ -153,6 +184,18 @@ class SqliteSink(BaseDataSink, RolloverSinkMixin):
         super(SqliteSink, self)._init_db()
 
 
+    @classmethod
+    def _register_adapters(cls):
+        """Registers sqlite3 type adapters and converters, only on first call."""
+        if cls._ADAPTERS_REGISTERED: return
+        for t in (dict, list, tuple):
+            sqlite3.register_adapter(t, lambda v: json.dumps(v, separators=(",", ":")))
+        for t in six.integer_types:
+            sqlite3.register_adapter(t, lambda x: str(x) if abs(x) > cls.MAX_INT else x)
+        sqlite3.register_converter("JSON", json.loads)
+        cls._ADAPTERS_REGISTERED = True
+
+
     def _load_schema(self):
         """Populates instance attributes with schema metainfo."""
         super(SqliteSink, self)._load_schema()
@@ -170,24 +213,53 @@ class SqliteSink(BaseDataSink, RolloverSinkMixin):
         """Inserts message to messages-table, and to pkg/MsgType tables."""
         with api.TypeMeta.make(msg, topic) as m:
             topic_id, typename = self._topics[m.topickey]["id"], m.typename
-        margs = dict(dt=api.to_datetime(stamp), timestamp=api.to_nsec(stamp),
-                     topic=topic, name=topic, topic_id=topic_id, type=typename,
-                     yaml=str(msg) if self._do_yaml else "", data=api.serialize_message(msg))
+        dt, nsec = self._convert_stamp(stamp)
+        margs = (topic_id, nsec, api.serialize_message(msg) if self._do_data else b"",
+                 topic, typename, dt, str(msg) if self._do_yaml else "")
         self._ensure_execute(self._get_dialect_option("insert_message"), margs)
         super(SqliteSink, self)._process_message(topic, msg, stamp)
 
 
+    def _stream(self):
+        """Writer-loop, processes messages from emit queue into database."""
+        try:
+            while True:
+                entry = self._queue.get()
+                try:  # Mark entry done even on error, to not deadlock join() in emit and flush
+                    if entry is None: break  # while
+                    topic, msg, stamp, match, index = entry
+                    super(SqliteSink, self).emit(topic, msg, stamp, match, index)
+                finally:
+                    self._queue.task_done()
+        except Exception as e:
+            self.thread_excepthook("Error writing SQLite output %r: %r" % (self.filename, e), e)
+        finally:
+            self._writer = None
+        try:
+            while self._queue.get_nowait() or True: self._queue.task_done()
+        except queue.Empty: pass
+
+
     def _connect(self):
         """Returns new database connection."""
         makedirs(os.path.dirname(self.filename))
         if self._overwrite: open(self.filename, "wb").close()
         db = sqlite3.connect(self.filename, check_same_thread=False,
                              detect_types=sqlite3.PARSE_DECLTYPES)
-        if not self.COMMIT_INTERVAL: db.isolation_level = None
-        db.row_factory = lambda cursor, row: dict(sqlite3.Row(cursor, row))
+        db.isolation_level = None  # Transactions controlled explicitly in _commit()
+        for pragma in self.CONNECT_PRAGMAS:  # Outside of any transaction, before schema
+            try: db.execute("PRAGMA %s" % pragma)
+            except sqlite3.Error: pass  # Journal mode can be locked by concurrent readers
+        db.row_factory = sqlite3.Row  # Zero-copy column access, dict() at mutable store sites
         return db
 
 
+    def _commit(self):
+        """Commits pending transaction, and begins a new one if doing interval commits."""
+        self.db.commit()
+        if self.COMMIT_INTERVAL: self._cursor.execute("BEGIN")
+
+
     def _execute_insert(self, sql, args):
         """Executes INSERT statement, returns inserted ID."""
         return self._cursor.execute(sql, args).lastrowid
@@ -200,7 +272,9 @@ class SqliteSink(BaseDataSink, RolloverSinkMixin):
 
     def _executescript(self, sql):
         """Executes SQL with one or more statements."""
-        self._cursor.executescript(sql)
+        self._cursor.executescript(sql)  # Commits any pending transaction implicitly
+        if self.COMMIT_INTERVAL and not self.db.in_transaction:
+            self._cursor.execute("BEGIN")
 
 
     def _get_next_id(self, table):
@@ -229,6 +303,8 @@ def init(*_, **__):
                                      "load additional SQL dialect options\n"
                                      "for SQLite output\n"
                                      "from a YAML or JSON file"),
+        ("message-data=true|false",  "whether to populate table field messages.data\n"
+                                     "in SQLite output (default true)"),
         ("message-yaml=true|false",  "whether to populate table field messages.yaml\n"
                                      "in SQLite output (default true)"),
         ("nesting=array|all",        "create tables for nested message types\n"
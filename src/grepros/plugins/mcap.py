@@ -14,8 +14,8 @@ Released under the BSD License.
 ## @namespace grepros.plugins.mcap
 from __future__ import absolute_import
 import atexit
-import copy
 import io
+import operator
 import os
 import time
 import types
@@ -31,12 +31,32 @@ elif "2" == os.getenv("ROS_VERSION"):
     try: import mcap_ros2 as mcap_ros, mcap_ros2.decoder, mcap_ros2.writer
     except ImportError: mcap_ros = None
 else: mcap_ros = None
+try: import numpy  # Optional, for faster timestamp statistics
+except ImportError: numpy = None
+try: import numba  # Optional, for JIT-compiling timestamp statistics
+except ImportError: numba = None
 import yaml
 
 from .. import common
 from .. common import ConsolePrinter
 from .. outputs import RolloverSinkMixin, Sink
 
+## Current UNIX timestamp in nanoseconds: time.time_ns if available (Py3.7+), else emulated
+_time_ns = getattr(time, "time_ns", None) or (lambda: int(time.time() * 10**9))
+
+if numpy is not None and numba is not None:
+    @numba.njit(cache=True)
+    def _median_diff(stamps):
+        """Returns median of differences between consecutive values in sorted int64 array."""
+        n = stamps.size - 1
+        diffs = numpy.empty(n, dtype=numpy.int64)
+        for i in range(n):
+            diffs[i] = stamps[i + 1] - stamps[i]
+        diffs.sort()
+        if n % 2: return float(diffs[n // 2])
+        return (diffs[n // 2 - 1] + diffs[n // 2]) / 2.
+else: _median_diff = None  # Compiled median-of-diffs kernel, requires numpy and numba
+
 
 class McapBag(api.BaseBag):
     """
@@ -62,14 +82,17 @@ class McapBag(api.BaseBag):
         if mode not in self.MODES: raise ValueError("invalid mode %r" % mode)
         self._mode           = mode
         self._topics         = {}     # {(topic, typename, typehash): message count}
+        self._topicset       = set()  # {topic, }
         self._types          = {}     # {(typename, typehash): message type class}
+        self._noclass        = set()  # {(typename, typehash) failed to load from disk, }
         self._typedefs       = {}     # {(typename, typehash): type definition text}
+        self._typehashes     = {}     # {typename: [typehash, ]}, in order of first sighting
         self._schemas        = {}     # {(typename, typehash): mcap.records.Schema}
         self._schematypes    = {}     # {mcap.records.Schema.id: (typename, typehash)}
         self._qoses          = {}     # {(topic, typename): [{qos profile dict}]}
         self._typefields     = {}     # {(typename, typehash): {field name: type name}}
         self._type_subtypes  = {}     # {(typename, typehash): {typename: typehash}}
-        self._field_subtypes = {}     # {(typename, typehash): {field name: (typename, typehash)}}
+        self._field_subtypes = {}     # {(typename, typehash): ((field name, (typename, typehash)), )}
         self._temporal_ctors = {}     # {typename: time/duration constructor}
         self._start_time     = None   # Bag start time, as UNIX timestamp
         self._end_time       = None   # Bag end time, as UNIX timestamp
@@ -79,6 +102,7 @@ class McapBag(api.BaseBag):
         self._writer         = None   # mcap_ros.Writer
         self._iterer         = None   # Generator from read_messages() for next()
         self._ttinfo         = None   # Cached result for get_type_and_topic_info()
+        self._topics_sorted  = None   # Cached result for topics property
         self._opened         = False  # Whether file has been opened at least once
         self._filename       = None   # File path, or None if stream
 
@@ -129,7 +153,7 @@ class McapBag(api.BaseBag):
 
         @param   typehash  message type definition hash, if any
         """
-        typehash = typehash or next((h for t, h in self._typedefs if t == typename), None)
+        typehash = typehash or next(iter(self._typehashes.get(typename, ())), None)
         typekey = (typename, typehash)
         if typekey not in self._types and typekey in self._typedefs:
             if api.ROS2:
@@ -153,14 +177,15 @@ class McapBag(api.BaseBag):
             return self._typedefs.get((api.get_message_type(msg_or_type),
                                        api.get_message_type_hash(msg_or_type)))
         typename = msg_or_type
-        return next((d for (n, h), d in self._typedefs.items() if n == typename), None)
+        hashes = self._typehashes.get(typename)
+        return self._typedefs.get((typename, hashes[0])) if hashes else None
 
 
     def get_message_type_hash(self, msg_or_type):
         """Returns ROS message type MD5 hash."""
         typename = msg_or_type
         if api.is_ros_message(msg_or_type): typename = api.get_message_type(msg_or_type)
-        return next((h for n, h in self._typedefs if n == typename), None)
+        return next(iter(self._typehashes.get(typename, ())), None)
 
 
     def get_qoses(self, topic, typename):
@@ -204,8 +229,17 @@ class McapBag(api.BaseBag):
             if topics and t not in topics: continue  # for
             mymedian = None
             if c > 1 and self._reader:
-                stamps = sorted(m.publish_time / 1E9 for _, _, m in self._reader.iter_messages([t]))
-                mymedian = median(sorted(s1 - s0 for s1, s0 in zip(stamps[1:], stamps[:-1])))
+                if numpy is not None:  # Sort, diff and median in C, without float temporaries
+                    stamps = numpy.fromiter((m.publish_time for _, _, m in
+                                             self._reader.iter_messages([t])), numpy.int64)
+                    stamps.sort()
+                    if stamps.size > 1:
+                        mymedian = (_median_diff(stamps) if _median_diff is not None else
+                                    float(numpy.median(numpy.diff(stamps)))) / 1E9
+                else:
+                    stamps = sorted(m.publish_time / 1E9
+                                    for _, _, m in self._reader.iter_messages([t]))
+                    mymedian = median(sorted(s1 - s0 for s1, s0 in zip(stamps[1:], stamps[:-1])))
             freq = 1.0 / mymedian if mymedian else None
             topicdict[t] = self.TopicTuple(n, c, len(self._qoses.get((t, n)) or []), freq)
         result = self.TypesAndTopicsTuple(msgtypes, topicdict)
@@ -232,15 +266,18 @@ class McapBag(api.BaseBag):
 
         topics = topics if isinstance(topics, list) else [topics] if topics else None
         start_ns, end_ns = (api.to_nsec(api.to_time(x)) for x in (start_time, end_time))
+        # Bind loop invariants to locals: skips repeated attribute lookups per message
+        make_time, make_meta = api.make_time, api.TypeMeta.make
+        BagMessage, schematypes, types_ = self.BagMessage, self._schematypes, self._types
         for schema, channel, message in self._reader.iter_messages(topics, start_ns, end_ns):
             if raw:
-                typekey = (typename, typehash) = self._schematypes[schema.id]
-                if typekey not in self._types:
-                    self._types[typekey] = self._make_message_class(schema, message)
-                msg = (typename, message.data, typehash, self._types[typekey])
+                typekey = (typename, typehash) = schematypes[schema.id]
+                if typekey not in types_:
+                    types_[typekey] = self._make_message_class(schema, message)
+                msg = (typename, message.data, typehash, types_[typekey])
             else: msg = self._decode_message(message, channel, schema)
-            api.TypeMeta.make(msg, channel.topic, self)
-            yield self.BagMessage(channel.topic, msg, api.make_time(nsecs=message.publish_time))
+            make_meta(msg, channel.topic, self)
+            yield BagMessage(channel.topic, msg, make_time(nsecs=message.publish_time))
             if self.closed: break  # for schema
 
 
@@ -267,24 +304,28 @@ class McapBag(api.BaseBag):
                 typename, typehash, typedef = meta.typename, meta.typehash, meta.definition
         topickey, typekey = (topic, typename, typehash), (typename, typehash)
 
-        nanosec = (time.time_ns() if hasattr(time, "time_ns") else int(time.time() * 10**9)) \
-                  if t is None else api.to_nsec(api.to_time(t))
+        nanosec = _time_ns() if t is None else api.to_nsec(api.to_time(t))
         if api.ROS2:
             if typekey not in self._schemas:
                 fullname = api.make_full_typename(typename)
                 schema = self._writer.register_msgdef(fullname, typedef)
                 self._schemas[typekey] = schema
-            schema, data = self._schemas[typekey], api.message_to_dict(msg)
+            schema, data = self._schemas[typekey], message_dict(msg)
             self._writer.write_message(topic, schema, data, publish_time=nanosec)
         else:
             self._writer.write_message(topic, msg, publish_time=nanosec)
 
         sec = nanosec / 1E9
-        self._start_time = sec if self._start_time is None else min(sec, self._start_time)
-        self._end_time   = sec if self._end_time   is None else min(sec, self._end_time)
+        if self._start_time is None or sec < self._start_time: self._start_time = sec
+        if self._end_time   is None or sec > self._end_time:   self._end_time   = sec
         self._topics[topickey] = self._topics.get(topickey, 0) + 1
-        self._types.setdefault(typekey, type(msg))
-        self._typedefs.setdefault(typekey, typedef)
+        if topic not in self._topicset:
+            self._topicset.add(topic)
+            self._topics_sorted = None
+        if typekey not in self._types: self._types[typekey] = type(msg)
+        if typekey not in self._typedefs:
+            self._typedefs[typekey] = typedef
+            self._typehashes.setdefault(typename, []).append(typehash)
         self._ttinfo = None
 
 
@@ -321,7 +362,9 @@ class McapBag(api.BaseBag):
     @property
     def topics(self):
         """Returns the list of topics in bag, in alphabetic order."""
-        return sorted((t for t, _, _ in self._topics), key=str.lower)
+        if self._topics_sorted is None:
+            self._topics_sorted = sorted(self._topicset, key=str.lower)
+        return self._topics_sorted
 
 
     @property
@@ -348,7 +391,7 @@ class McapBag(api.BaseBag):
 
     def __contains__(self, key):
         """Returns whether bag contains given topic."""
-        return any(key == t for t, _, _ in self._topics)
+        return key in self._topicset
 
 
     def __next__(self):
@@ -366,16 +409,15 @@ class McapBag(api.BaseBag):
         @param   channel  mcap.records.Channel instance for message
         @param   schema   mcap.records.Schema instance for message type
         """
-        cls = self._make_message_class(schema, message, generate=False)
-        if api.ROS2 and not issubclass(cls, types.SimpleNamespace):
-            msg = api.deserialize_message(message.data, cls)
-        else:
-            msg = self._decoder.decode(schema=schema, message=message)
-            if api.ROS2:  # MCAP ROS2 message classes need monkey-patching with expected API
-                msg = self._patch_message(msg, *self._schematypes[schema.id])
-                # Register serialized binary, as MCAP does not support serializing its own creations
-                api.TypeMeta.make(msg, channel.topic, self, data=message.data)
         typekey = self._schematypes[schema.id]
+        cls = self._make_message_class(schema, message, generate=False)
+        if api.ROS2 and cls is not None and not issubclass(cls, types.SimpleNamespace):
+            return api.deserialize_message(message.data, cls)  # Class already in self._types
+        msg = self._decoder.decode(schema=schema, message=message)
+        if api.ROS2:  # MCAP ROS2 message classes need monkey-patching with expected API
+            msg = self._patch_message(msg, *typekey)
+            # Register serialized binary, as MCAP does not support serializing its own creations
+            api.TypeMeta.make(msg, channel.topic, self, data=message.data)
         if typekey not in self._types: self._types[typekey] = type(msg)
         return msg
 
@@ -389,12 +431,14 @@ class McapBag(api.BaseBag):
         @param   generate  generate message class dynamically if not available
         """
         typekey = (typename, typehash) = self._schematypes[schema.id]
-        if api.ROS2 and typekey not in self._types:
+        if api.ROS2 and typekey not in self._types and typekey not in self._noclass:
             try:  # Try loading class from disk for full compatibility
                 cls = api.get_message_class(typename)
                 clshash = api.get_message_type_hash(cls)
                 if typehash == clshash: self._types[typekey] = cls
-            except Exception: pass  # ModuleNotFoundError, AttributeError etc
+                else: self._noclass.add(typekey)  # Local class differs: skip retries
+            except Exception:  # ModuleNotFoundError, AttributeError etc
+                self._noclass.add(typekey)
         if typekey not in self._types and generate:
             if api.ROS2:  # MCAP ROS2 message classes need monkey-patching with expected API
                 msg = self._decoder.decode(schema=schema, message=message)
@@ -418,10 +462,10 @@ class McapBag(api.BaseBag):
         if typekey not in self._typefields:
             fields = api.parse_definition_fields(typename, self._typedefs[typekey])
             self._typefields[typekey] = fields
-            self._field_subtypes[typekey] = {n: (s, h) for n, t in fields.items()
-                                             for s in [api.scalar(t)]
-                                             if s not in api.ROS_BUILTIN_TYPES
-                                             for h in [self._type_subtypes[typekey][s]]}
+            self._field_subtypes[typekey] = tuple((n, (s, h)) for n, t in fields.items()
+                                                  for s in [api.scalar(t)]
+                                                  if s not in api.ROS_BUILTIN_TYPES
+                                                  for h in [self._type_subtypes[typekey][s]])
 
         # mcap_ros2 creates a dynamic class for each message, having __slots__
         # but no other ROS2 API hooks; even the class module is "mcap_ros2.dynamic".
@@ -429,8 +473,8 @@ class McapBag(api.BaseBag):
         cls.SLOT_TYPES = ()  # rosidl_runtime_py.utilities.is_message() checks for presence
         cls._fields_and_field_types = dict(self._typefields[typekey])
         cls.get_fields_and_field_types = message_get_fields_and_field_types
-        cls.__copy__     = copy_with_slots  # MCAP message classes lack support for copy
-        cls.__deepcopy__ = deepcopy_with_slots
+        cls.__reduce_ex__ = message_reduce_ex  # MCAP message classes lack copy support
+        cls.__setstate__  = message_setstate
 
         return cls
 
@@ -445,10 +489,13 @@ class McapBag(api.BaseBag):
         @return            original message patched, or new instance if ROS2 temporal type
         """
         result = message
-        # [(field value, (field type name, field type hash), parent, (field name, ?array index))]
-        stack = [(message, (typename, typehash), None, ())]
-        while stack:
-            msg, typekey, parent, path = stack.pop(0)
+        # Traversal stack as parallel lists, popped in sync:
+        # field values, (field type name, field type hash), parents, (field name, ?array index)
+        msgs, typekeys = [message], [(typename, typehash)]
+        parents, paths = [None], [()]
+        while msgs:
+            msg, typekey = msgs.pop(), typekeys.pop()  # Traversal order is irrelevant: O(1) pop
+            parent, path = parents.pop(), paths.pop()
             mycls, typename = type(msg), typekey[0]
 
             if typename in self._temporal_ctors:
@@ -457,16 +504,22 @@ class McapBag(api.BaseBag):
                 if msg is message: result = msg2                     # Replace input message
                 elif len(path) == 1: setattr(parent, path[0], msg2)  # Set scalar field
                 else: getattr(parent, path[0])[path[1]] = msg2       # Set array field element
-                continue  # while stack
+                continue  # while msgs
 
             self._patch_message_class(mycls, *typekey)
 
-            for name, subtypekey in self._field_subtypes[typekey].items():
+            for name, subtypekey in self._field_subtypes[typekey]:
                 v = getattr(msg, name)
                 if isinstance(v, list):  # Queue each array element for patching
-                    stack.extend((x, subtypekey, msg, (name, i)) for i, x in enumerate(v))
+                    msgs.extend(v)
+                    typekeys.extend([subtypekey] * len(v))
+                    parents.extend([msg] * len(v))
+                    paths.extend((name, i) for i in range(len(v)))
                 else:  # Queue scalar field for patching
-                    stack.append((v, subtypekey, msg, (name, )))
+                    msgs.append(v)
+                    typekeys.append(subtypekey)
+                    parents.append(msg)
+                    paths.append((name, ))
 
         return result
 
@@ -485,30 +538,39 @@ class McapBag(api.BaseBag):
                 return None
 
         defhashes = {}  # Cached {type definition full text: type hash}
+        qosdefs   = {}  # Cached {QoS profiles YAML text: [{qos profile dict}]}
+        msgcounts = summary.statistics.channel_message_counts
+        schemas, schematypes = {}, {}  # Staged locally, applied in one bulk update
         for cid, channel in summary.channels.items():
             schema = summary.schemas[channel.schema_id]
             topic, typename = channel.topic, api.canonical(schema.name)
 
             typedef = schema.data.decode("utf-8")  # Full definition including subtype definitions
             subtypedefs, nesting = api.parse_definition_subtypes(typedef, nesting=True)
-            typehash = channel.metadata.get("md5sum") or \
-                       make_hash(typename, typedef, tuple(subtypedefs.items()))
+            subdefs = tuple(subtypedefs.items())
+            typehash = channel.metadata.get("md5sum") or defhashes.get(typedef) or \
+                       make_hash(typename, typedef, subdefs)
             topickey, typekey = (topic, typename, typehash), (typename, typehash)
 
-            qoses = None
-            if channel.metadata.get("offered_qos_profiles"):
-                try: qoses = yaml.safe_load(channel.metadata["offered_qos_profiles"])
+            qoses, qostext = None, channel.metadata.get("offered_qos_profiles")
+            if qostext and qostext in qosdefs: qoses = qosdefs[qostext]
+            elif qostext:  # Identical QoS strings tend to repeat across channels
+                try: qoses = qosdefs[qostext] = yaml.safe_load(qostext)
                 except Exception as e:
                     ConsolePrinter.warn("Error parsing topic QoS profiles from %r: %s.",
-                                        channel.metadata["offered_qos_profiles"], e)
+                                        qostext, e)
 
-            self._topics.setdefault(topickey, 0)
-            self._topics[topickey] += summary.statistics.channel_message_counts[cid]
+            self._topics[topickey] = self._topics.get(topickey, 0) + msgcounts[cid]
+            self._topicset.add(topic)
+            if typekey not in self._typedefs:
+                self._typehashes.setdefault(typename, []).append(typehash)
             self._typedefs[typekey] = typedef
             defhashes[typedef] = typehash
             for t, d in subtypedefs.items():  # Populate subtype definitions and hashes
-                h = defhashes[d] if d in defhashes else make_hash(t, d, tuple(subtypedefs.items()))
-                self._typedefs.setdefault((t, h), d)
+                h = defhashes[d] if d in defhashes else make_hash(t, d, subdefs)
+                if (t, h) not in self._typedefs:
+                    self._typedefs[(t, h)] = d
+                    self._typehashes.setdefault(t, []).append(h)
                 self._type_subtypes.setdefault(typekey, {})[t] = h
                 defhashes[d] = h
             for t, subtypes in nesting.items():  # Populate all nested type references
@@ -518,8 +580,11 @@ class McapBag(api.BaseBag):
                     self._type_subtypes.setdefault((t, h), {})[t2] = h2
 
             if qoses: self._qoses[topickey] = qoses
-            self._schemas[typekey] = schema
-            self._schematypes[schema.id] = typekey
+            schemas[typekey] = schema
+            schematypes[schema.id] = typekey
+        self._schemas.update(schemas)
+        self._schematypes.update(schematypes)
+        self._topics_sorted = None
 
 
     @classmethod
@@ -527,31 +592,44 @@ class McapBag(api.BaseBag):
         """Returns whether file is recognizable as MCAP format."""
         if common.is_stream(f):
             pos, _ = f.tell(), f.seek(0)
-            result, _ = (f.read(len(cls.MCAP_MAGIC)) == cls.MCAP_MAGIC), f.seek(pos)
-        elif os.path.isfile(f) and os.path.getsize(f):
-            with open(f, "rb") as f:
-                result = (f.read(len(cls.MCAP_MAGIC)) == cls.MCAP_MAGIC)
+            result, _ = f.read(len(cls.MCAP_MAGIC)).startswith(cls.MCAP_MAGIC), f.seek(pos)
         else:
-            ext = os.path.splitext(f or "")[-1].lower()
-            result = ext in McapSink.FILE_EXTENSIONS
+            head = None
+            try:  # Single file descriptor probe instead of separate stat calls
+                fd = os.open(f, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+                try: head = os.read(fd, len(cls.MCAP_MAGIC))
+                finally: os.close(fd)
+            except OSError: pass  # Missing file, directory, or no permission
+            if head: result = head.startswith(cls.MCAP_MAGIC)
+            else:  # Nonexistent, unreadable or empty file: check by extension
+                ext = os.path.splitext(f or "")[-1].lower()
+                result = ext in McapSink.FILE_EXTENSIONS
         return result
 
 
 
-def copy_with_slots(self):
-    """Returns a shallow copy, with slots populated manually."""
-    result = self.__class__.__new__(self.__class__)
-    for n in self.__slots__:
-        setattr(result, n, copy.copy(getattr(self, n)))
-    return result
+def message_dict(msg):
+    """
+    Returns ROS message as dictionary for MCAP writer.
+
+    MCAP-decoded messages are returned as a shallow attribute copy: the writer
+    reads nested fields by attribute access, needing no recursive conversion.
+    """
+    if isinstance(msg, types.SimpleNamespace):
+        fields = getattr(msg, "__slots__", None)  # Decoded classes are slotted, plain ones not
+        return {n: getattr(msg, n) for n in fields} if fields else dict(vars(msg))
+    return api.message_to_dict(msg)
+
+
+def message_reduce_ex(self, protocol):
+    """Returns (constructor, args, state) for copy support (patch method for MCAP message classes)."""
+    cls = self.__class__
+    return (cls.__new__, (cls, ), {n: getattr(self, n) for n in self.__slots__})
 
 
-def deepcopy_with_slots(self, memo):
-    """Returns a deep copy, with slots populated manually."""
-    result = self.__class__.__new__(self.__class__)
-    for n in self.__slots__:
-        setattr(result, n, copy.deepcopy(getattr(self, n), memo))
-    return result
+def message_setstate(self, state):
+    """Restores message fields from copy state (patch method for MCAP message classes)."""
+    for k, v in state.items(): setattr(self, k, v)
 
 
 def message_get_fields_and_field_types(self):
@@ -561,8 +639,14 @@ def message_get_fields_and_field_types(self):
 
 def message_repr(self):
     """Returns a string representation of ROS message."""
-    fields = ", ".join("%s=%r" % (n, getattr(self, n)) for n in self.__slots__)
-    return "%s(%s)" % (self.__name__, fields)
+    cls = type(self)
+    if "_repr_fmt" not in cls.__dict__:  # Build "Name(a=%r, b=%r)" template once per class
+        cls._repr_fmt = "%s(%s)" % (self.__name__,
+                                    ", ".join("%s=%%r" % n for n in cls.__slots__))
+        cls._repr_getter = operator.attrgetter(*cls.__slots__) if cls.__slots__ else None
+    if cls._repr_getter is None: return cls._repr_fmt
+    vals = cls._repr_getter(self)
+    return cls._repr_fmt % (vals if len(cls.__slots__) > 1 else (vals, ))
 
 
 
@@ -602,6 +686,7 @@ class McapSink(Sink, RolloverSinkMixin):
         self._file          = None  # Open file() object
         self._writer        = None  # mcap_ros.writer.Writer object
         self._schemas       = {}    # {(typename, typehash): mcap.records.Schema}
+        self._msg_schemas   = {}    # {(message class, topic): mcap.records.Schema}
         self._overwrite     = None
         self._close_printed = False
 
@@ -641,13 +726,16 @@ class McapSink(Sink, RolloverSinkMixin):
         self._ensure_open()
         kwargs = dict(publish_time=api.to_nsec(stamp), sequence=index)
         if api.ROS2:
-            with api.TypeMeta.make(msg, topic) as m:
-                typekey = m.typekey
-                if typekey not in self._schemas:
-                    fullname = api.make_full_typename(m.typename)
-                    self._schemas[typekey] = self._writer.register_msgdef(fullname, m.definition)
-            schema, data = self._schemas[typekey], api.message_to_dict(msg)
-            self._writer.write_message(topic, schema, data, **kwargs)
+            schema = self._msg_schemas.get((type(msg), topic))
+            if schema is None:  # Register schema on first sighting of message class on topic
+                with api.TypeMeta.make(msg, topic) as m:
+                    typekey = m.typekey
+                    if typekey not in self._schemas:
+                        fullname = api.make_full_typename(m.typename)
+                        self._schemas[typekey] = self._writer.register_msgdef(fullname,
+                                                                              m.definition)
+                schema = self._msg_schemas[(type(msg), topic)] = self._schemas[typekey]
+            self._writer.write_message(topic, schema, message_dict(msg), **kwargs)
         else:
             self._writer.write_message(topic, msg, **kwargs)
         super(McapSink, self).emit(topic, msg, stamp, match, index)
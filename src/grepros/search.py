@@ -18,9 +18,18 @@ import collections
 import functools
 import logging
 import re
+import threading
 
 import six
 
+try: from concurrent.futures import ThreadPoolExecutor  # Py3
+except ImportError: ThreadPoolExecutor = None            # Py2: pip install futures
+
+try: import hyperscan                 # Optional regex engine
+except ImportError: hyperscan = None  # pip install hyperscan
+try: import re2                       # Optional regex engine
+except ImportError: re2 = None        # pip install google-re2
+
 from . import api
 from . import common
 from . import inputs
@@ -45,7 +54,10 @@ class Scanner(object):
     DEFAULT_ARGS = dict(PATTERN=(), CASE=False, FIXED_STRING=False, INVERT=False, EXPRESSION=False,
                         HIGHLIGHT=False, NTH_MATCH=1, BEFORE=0, AFTER=0, CONTEXT=0, MAX_COUNT=0,
                         MAX_PER_TOPIC=0, MAX_TOPICS=0, SELECT_FIELD=(), NOSELECT_FIELD=(),
-                        MATCH_WRAPPER="**")
+                        MATCH_WRAPPER="**", REGEX_ENGINE="re", JOBS=1)
+
+    ## Sentinel for match result not yet computed, in _read_matches()
+    _PENDING = object()
 
 
     def __init__(self, args=None, **kwargs):
@@ -72,6 +84,10 @@ class Scanner(object):
         @param   args.match_wrapper       string to wrap around matched values in find() and match(),
                                           both sides if one value, start and end if more than one,
                                           or no wrapping if zero values (default "**")
+        @param   args.regex_engine        regular expression engine to match patterns with:
+                                          "re2" or "hyperscan" if available (default "re")
+        @param   args.jobs                number of worker threads to match messages with
+                                          (default 1, used for offline sources only)
         @param   kwargs                   any and all arguments as keyword overrides, case-insensitive
         <!--sep-->
 
@@ -96,6 +112,9 @@ class Scanner(object):
         """
         # {key: [(() if any field else ('nested', 'path') or re.Pattern, re.Pattern), ]}
         self._patterns = {}
+        # {pattern argument: (path Pattern or (), value Pattern)},
+        # persisted across validations to avoid recompiles: args are fixed per instance
+        self._compiled = {}
         self._expressor = ExpressionTree()
         self._expression = None # Nested [op, val] like ["NOT", ["VAL", "skip this"]]
         # {(topic, typename, typehash): {message ID: message}}
@@ -107,7 +126,11 @@ class Scanner(object):
         # {(topic, typename, typehash): {message ID: True if matched else False if emitted else None}}
         self._statuses = collections.defaultdict(collections.OrderedDict)
         # Patterns to check in message plaintext and skip full matching if not found
-        self._brute_prechecks = []     # [re.Pattern to match against message fulltext for early skip]
+        # [re.Pattern, or lowercased literal if fixed strings, for message fulltext early skip]
+        self._brute_prechecks = []
+        self._hyperscan_db    = None   # hyperscan.Database over precheck patterns, if engine used
+        # Guards hyperscan scans: database has one scratch space, unsafe for concurrent scan()
+        self._hyperscan_lock  = threading.Lock()
         self._idcounter       = 0      # Counter for unique message IDs
         self._settings = {             # Various cached settings
             "highlight":       None,   # Highlight matched values in message fields
@@ -213,13 +236,18 @@ class Scanner(object):
         if self.valid is not None and not reset: return self.valid
 
         errors = collections.defaultdict(list)  # {category: [error, ]}
+        engines = {"re": re, "re2": re2, "hyperscan": hyperscan}
+        if self.args.REGEX_ENGINE not in engines:
+            errors[""].append("Unknown regex engine: %r" % (self.args.REGEX_ENGINE, ))
+        elif not engines[self.args.REGEX_ENGINE]:
+            errors[""].append("%s not installed, cannot use regex engine %r" %
+                              ({"re2": "google-re2"}.get(self.args.REGEX_ENGINE,
+                               self.args.REGEX_ENGINE), self.args.REGEX_ENGINE))
         if not self.args.FIXED_STRING and not self.args.EXPRESSION:
-            for v in self.args.PATTERN:  # Pre-check patterns before parsing for full error state
-                split = v.find("=", 1, -1)  # May be "PATTERN" or "attribute=PATTERN"
-                v = v[split + 1:] if split > 0 else v
-                try: re.compile(re.escape(v) if self.args.FIXED_STRING else v)
-                except Exception as e:
-                    errors["Invalid regular expression"].append("'%s': %s" % (v, e))
+            for v in self.args.PATTERN:  # Pre-compile patterns before parsing for full error state
+                try: self._make_pattern(v)
+                except ValueError as e:
+                    errors["Invalid regular expression"].append(str(e))
         try: self._parse_patterns()
         except Exception as e: errors[""].append(str(e))
 
@@ -251,15 +279,16 @@ class Scanner(object):
         @return  tuples of (topic, msg, stamp, matched optionally highlighted msg, index in topic)
         """
         batch_matched, batch = False, None
-        for topic, msg, stamp in self.source.read():
-            if batch != self.source.get_batch():
-                batch, batch_matched = self.source.get_batch(), False
+        for msgbatch, topic, msg, stamp, matched in self._read_matches():
+            if batch != msgbatch:
+                batch, batch_matched = msgbatch, False
                 if self._counts: self._clear_data()
 
             msgid = self._idcounter = self._idcounter + 1
             topickey = api.TypeMeta.make(msg, topic).topickey
             self._register_message(topickey, msgid, msg, stamp)
-            matched = self._is_processable(topic, msg, stamp) and self.get_match(msg)
+            matched = self._is_processable(topic, msg, stamp) and \
+                      (self.get_match(msg) if matched is self._PENDING else matched)
 
             self.source.notify(matched)
             if matched and not self._counts[topickey][True] % (self.args.NTH_MATCH or 1):
@@ -281,6 +310,36 @@ class Scanner(object):
                 self.source.close_batch()
 
 
+    def _read_matches(self):
+        """
+        Yields (source batch, topic, msg, stamp, match) from source.
+
+        Match is `Scanner._PENDING` if reading single-threaded,
+        else the get_match() result, precomputed in worker threads
+        if args.jobs over 1 and source is not live.
+        """
+        if self.args.JOBS < 2 or not ThreadPoolExecutor \
+        or isinstance(self.source, (inputs.AppSource, inputs.LiveSource)):
+            for topic, msg, stamp in self.source.read():
+                yield self.source.get_batch(), topic, msg, stamp, self._PENDING
+            return
+
+        def entries():  # Batch captured at read time: matching lags behind source position
+            for topic, msg, stamp in self.source.read():
+                yield self.source.get_batch(), topic, msg, stamp
+        window = self.args.JOBS * 10  # Read-ahead limit, to bound memory use
+        pending = collections.deque()  # [(entry, future), ]
+        with ThreadPoolExecutor(max_workers=self.args.JOBS) as pool:
+            for entry in entries():
+                pending.append((entry, pool.submit(self.get_match, entry[2])))
+                if len(pending) < window: continue  # for entry
+                entry, future = pending.popleft()
+                yield entry + (future.result(), )
+            while pending:
+                entry, future = pending.popleft()
+                yield entry + (future.result(), )
+
+
     def _is_processable(self, topic, msg, stamp):
         """
         Returns whether processing current message in topic is acceptable:
@@ -343,41 +402,83 @@ class Scanner(object):
                 dct is self._messages and api.TypeMeta.discard(value)
 
 
+    def _make_pattern(self, v):
+        """
+        Returns pattern argument compiled as (path Pattern or (), value Pattern),
+        from local cache if already compiled. Raises ValueError on invalid pattern.
+        """
+        if v in self._compiled: return self._compiled[v]
+        FLAGS = re.DOTALL | (0 if self.args.CASE else re.I)
+        split = v.find("=", 1, -1)  # May be "PATTERN" or "attribute=PATTERN"
+        v2, path = (v[split + 1:], v[:split]) if split > 0 else (v, ())
+        # Special case if '' or "": add pattern for matching empty string
+        v2 = "|^$" if v2 in ("''", '""') else (re.escape(v2) if self.args.FIXED_STRING else v2)
+        path = re.compile(r"(^|\.)%s($|\.)" % ".*".join(map(re.escape, path.split("*")))) \
+               if path else ()
+        engine = re2 if re2 and "re2" == self.args.REGEX_ENGINE else re
+        try:
+            try: compiled = engine.compile("(%s)" % v2, FLAGS)
+            except Exception:  # Fall back to re on syntax unsupported by re2
+                if engine is re: raise
+                compiled = re.compile("(%s)" % v2, FLAGS)
+        except Exception as e:
+            raise ValueError("'%s': %s" % (v2, e))
+        result = self._compiled[v] = (path, compiled)
+        return result
+
+
     def _parse_patterns(self):
         """Parses pattern arguments into re.Patterns. Raises on invalid pattern."""
-        NOBRUTE_SIGILS = r"\A", r"\Z", "?("  # Regex specials ruling out brute precheck
-        BRUTE, FLAGS = not self.args.INVERT, re.DOTALL | (0 if self.args.CASE else re.I)
         self._patterns.clear()
         self._expression = None
+        self._hyperscan_db = None
         del self._brute_prechecks[:]
+        selects, noselects = self.args.SELECT_FIELD, self.args.NOSELECT_FIELD
+        for key, vals in [("select", selects), ("noselect", noselects)]:
+            self._patterns[key] = [(tuple(v.split(".")), common.path_to_regex(v)) for v in vals]
+        if not self.args.PATTERN:  # Fast path: add match-all pattern, skip matcher setup
+            self._patterns["content"] = [self.ANY_MATCHES[0]]
+            return
+
+        NOBRUTE_SIGILS = r"\A", r"\Z", "?("  # Regex specials ruling out brute precheck
+        BRUTE = not self.args.INVERT
         contents = []
 
         def make_pattern(v):
             """Returns (path Pattern or (), value Pattern)."""
-            split = v.find("=", 1, -1)
-            v, path = (v[split + 1:], v[:split]) if split > 0 else (v, ())
-            # Special case if '' or "": add pattern for matching empty string
-            v = "|^$" if v in ("''", '""') else (re.escape(v) if self.args.FIXED_STRING else v)
-            path = re.compile(r"(^|\.)%s($|\.)" % ".*".join(map(re.escape, path.split("*")))) \
-                   if path else ()
-            try: return (path, re.compile("(%s)" % v, FLAGS))
-            except Exception as e:
-                raise ValueError("Invalid regular expression\n  '%s': %s" % (v, e))
+            try: return self._make_pattern(v)
+            except ValueError as e:
+                raise ValueError("Invalid regular expression\n  %s" % e)
 
         if self.args.EXPRESSION and self.args.PATTERN:
             self._expression = self._expressor.parse(" ".join(self.args.PATTERN), make_pattern)
         for v in self.args.PATTERN if not self._expression else ():
             contents.append(make_pattern(v))
             if BRUTE and (self.args.FIXED_STRING or not any(x in v for x in NOBRUTE_SIGILS)):
-                if self.args.FIXED_STRING: v = re.escape(v)
-                self._brute_prechecks.append(re.compile(v, re.I | re.M))
-        if not self.args.PATTERN:  # Add match-all pattern
-            contents.append(self.ANY_MATCHES[0])
+                if self.args.FIXED_STRING: self._brute_prechecks.append(v.lower())
+                else: self._brute_prechecks.append(re.compile(v, re.I | re.M))
+        if self.args.INVERT and not self._expression and len(contents) > 1:
+            # Inverted patterns have any-semantics: merge into one alternation per field
+            # for a single regex pass per value instead of one pass per pattern
+            merged, groups = [], collections.OrderedDict()  # {path pattern text or (): [..]}
+            for path, p in contents:
+                groups.setdefault(path.pattern if path else (), []).append((path, p))
+            FLAGS = re.DOTALL | (0 if self.args.CASE else re.I)
+            for pp in groups.values():
+                merged.append(pp[0] if len(pp) < 2 else
+                              (pp[0][0], re.compile("|".join(p.pattern for _, p in pp), FLAGS)))
+            contents = merged
         self._patterns["content"] = contents
 
-        selects, noselects = self.args.SELECT_FIELD, self.args.NOSELECT_FIELD
-        for key, vals in [("select", selects), ("noselect", noselects)]:
-            self._patterns[key] = [(tuple(v.split(".")), common.path_to_regex(v)) for v in vals]
+        if hyperscan and "hyperscan" == self.args.REGEX_ENGINE and self._brute_prechecks \
+        and not self.args.FIXED_STRING:
+            db = hyperscan.Database()
+            exprs = [p.pattern.encode("utf-8") for p in self._brute_prechecks]
+            flags = [hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_MULTILINE |
+                     hyperscan.HS_FLAG_SINGLEMATCH] * len(exprs)
+            try: db.compile(expressions=exprs, ids=list(range(len(exprs))), flags=flags)
+            except Exception: db = None  # Syntax unsupported by hyperscan: fall back to re
+            self._hyperscan_db = db
 
 
     def _register_message(self, topickey, msgid, msg, stamp):
@@ -520,7 +621,18 @@ class Scanner(object):
 
         if self._brute_prechecks:
             text  = "\n".join("%r" % (v, ) for _, v, _ in api.iter_message_fields(msg, flat=True))
-            if not all(any(p.finditer(text)) for p in self._brute_prechecks):
+            if self.args.FIXED_STRING:  # Lowercased literals: C-level substring scan
+                text = text.lower()
+                if not all(v in text for v in self._brute_prechecks):
+                    return None  # Skip detailed matching if patterns not present at all
+            elif self._hyperscan_db:
+                found = set()  # {index of precheck pattern found}
+                with self._hyperscan_lock:
+                    self._hyperscan_db.scan(text.encode("utf-8"),
+                                            match_event_handler=lambda i, *_: bool(found.add(i)))
+                if len(found) < len(self._brute_prechecks):
+                    return None  # Skip detailed matching if patterns not present at all
+            elif not all(any(p.finditer(text)) for p in self._brute_prechecks):
                 return None  # Skip detailed matching if patterns not present at all
 
         WRAPS         = self._settings["wraps"]